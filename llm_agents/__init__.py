@@ -1,10 +1,33 @@
-from llm_agents.agent import Agent
-from llm_agents.llm import ChatLLM
-from llm_agents.tools.python_repl import PythonREPLTool
-from llm_agents.tools.hackernews import HackerNewsSearchTool
-from llm_agents.tools.search import SerpAPITool
-from llm_agents.tools.searx import SearxSearchTool
-from llm_agents.tools.google_search import GoogleSearchTool
-
-__all__ = ['Agent', 'ChatLLM', 'PythonREPLTool',
-           'HackerNewsSearchTool', 'SerpAPITool', 'SearxSearchTool', 'GoogleSearchTool']
\ No newline at end of file
+import importlib
+
+# Public names and the modules defining them. They are imported on first access (PEP 562),
+# so using one tool doesn't pull in the dependencies (openai, lxml, aiohttp, ...) of all the others.
+_LAZY_IMPORTS = {
+    'Agent': 'llm_agents.agent',
+    'ChatLLM': 'llm_agents.llm',
+    'InMemoryCache': 'llm_agents.cache',
+    'DiskCache': 'llm_agents.cache',
+    'RedisCache': 'llm_agents.cache',
+    'SQLiteCache': 'llm_agents.cache',
+    'SemanticCache': 'llm_agents.cache',
+    'PythonREPLTool': 'llm_agents.tools.python_repl',
+    'HackerNewsSearchTool': 'llm_agents.tools.hackernews',
+    'SerpAPITool': 'llm_agents.tools.search',
+    'SearxSearchTool': 'llm_agents.tools.searx',
+    'GoogleSearchTool': 'llm_agents.tools.google_search',
+}
+
+__all__ = ['Agent', 'ChatLLM', 'InMemoryCache', 'DiskCache', 'RedisCache', 'SQLiteCache', 'SemanticCache',
+           'PythonREPLTool', 'HackerNewsSearchTool', 'SerpAPITool', 'SearxSearchTool', 'GoogleSearchTool']
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,16 +1,22 @@
+import ast
+import asyncio
 import datetime
+import io
 import re
+import time
 
-from pydantic import BaseModel
-from typing import List, Dict, Tuple
-from llm_agents.llm import ChatLLM
-from llm_agents.tools.base import ToolInterface
+from pydantic import BaseModel, PrivateAttr
+from typing import List, Dict, Optional, Tuple
+from llm_agents.llm import ChatLLM, pooled_session
+from llm_agents.tools.base import ToolInterface, shared_client_session
 from llm_agents.tools.python_repl import PythonREPLTool
 
 
 FINAL_ANSWER_TOKEN = "Final Answer:"
 OBSERVATION_TOKEN = "Observation:"
 THOUGHT_TOKEN = "Thought:"
+ACTION_TOKEN = "Action:"
+ACTION_INPUT_TOKEN = "Action Input:"
 PROMPT_TEMPLATE = """Today is {today} and you can use tools to get new information. Answer the question as best as you can using the following tools: 
 
 {tool_description}
@@ -21,7 +27,8 @@ Question: the input question you must answer
 Thought: comment on what you want to do next
 Action: the action to take, exactly one element of [{tool_names}]
 Action Input: the input to the action
-Observation: the result of the action
+(you may list several independent Action/Action Input pairs, they run in parallel)
+Observation: the result of each action, in the same order
 ... (this Thought/Action/Action Input/Observation repeats N times, use it until you are sure of the answer)
 Thought: I now know the final answer
 Final Answer: your final answer to the original input question
@@ -32,66 +39,263 @@ Question: {question}
 Thought: {previous_responses}
 """
 
+# Questions which are plain arithmetic, like "What is 7 * 9 - 34 in Python?", are answered without the LLM
+ARITHMETIC_QUESTION_REGEX = re.compile(
+    r"\s*(?:what is|what's|calculate|compute)?\s*([\d\s+\-*/%().]+?)\s*(?:in python)?\s*[?.!]?\s*",
+    re.IGNORECASE
+)
+# Longer questions go to the LLM. Deeply nested or huge expressions can't be parsed or printed anyway.
+MAX_ARITHMETIC_QUESTION_CHARS = 200
+# No ast.Pow, so a question can't make us compute something like 9 ** 9 ** 9
+ARITHMETIC_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.UAdd, ast.USub
+)
+
+
+def _evaluate_arithmetic(question: str) -> Optional[str]:
+    """Answer a question which is just an arithmetic expression, None for anything else."""
+    if len(question) > MAX_ARITHMETIC_QUESTION_CHARS:
+        return None
+    match = ARITHMETIC_QUESTION_REGEX.fullmatch(question)
+    if not match:
+        return None
+    try:
+        tree = ast.parse(match.group(1).strip(), mode="eval")
+    except (SyntaxError, RecursionError, MemoryError):
+        return None
+    nodes = list(ast.walk(tree))
+    if not all(isinstance(node, ARITHMETIC_NODES) for node in nodes):
+        return None
+    if not any(isinstance(node, ast.BinOp) for node in nodes):
+        return None  # Just a number, like "What is 2023?"
+    try:
+        return str(eval(compile(tree, "<question>", "eval"), {"__builtins__": {}}))
+    except (ArithmeticError, RecursionError, MemoryError, ValueError):
+        # ValueError: results too long to convert to a string
+        return None
+
+
+# (date string, monotonic time it was computed), refreshed at most once a minute
+_TODAY_CACHE = [None, 0.0]
+
+
+def _today() -> str:
+    now = time.monotonic()
+    if _TODAY_CACHE[0] is None or now - _TODAY_CACHE[1] > 60:
+        _TODAY_CACHE[0] = str(datetime.date.today())
+        _TODAY_CACHE[1] = now
+    return _TODAY_CACHE[0]
+
 
 class Agent(BaseModel):
     llm: ChatLLM
     tools: List[ToolInterface]
     prompt_template: str = PROMPT_TEMPLATE
     max_loops: int = 15
+    # Maximum number of tools running at the same time when the LLM asks for several actions at once
+    max_concurrent_tools: int = 8
+    # Answer plain arithmetic questions directly instead of asking the LLM
+    evaluate_arithmetic: bool = True
+    # When the transcript grows beyond this many characters, all but the last two steps are replaced
+    # by an LLM written summary, so later steps don't resend the whole history. None disables it.
+    max_context_chars: Optional[int] = None
+    # Send the instructions before the question as a system message, so they form a separate prefix
+    # which is identical across all steps and runs of this agent
+    system_prompt: bool = False
     # The stop pattern is used, so the LLM does not hallucinate until the end
     stop_pattern: List[str] = [f'\n{OBSERVATION_TOKEN}', f'\n\t{OBSERVATION_TOKEN}']
 
+    # Derived from the tools once at construction, instead of on every access
+    _tool_description: str = PrivateAttr()
+    _tool_names: str = PrivateAttr()
+    _tool_by_names: Dict[str, ToolInterface] = PrivateAttr()
+    _partial_prompt: str = PrivateAttr()
+    _system_template: Optional[str] = PrivateAttr(default=None)
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._tool_description = "\n".join(f"{tool.name}: {tool.description}" for tool in self.tools)
+        self._tool_names = ",".join(tool.name for tool in self.tools)
+        self._tool_by_names = {tool.name: tool for tool in self.tools}
+
+        # The prompt template with the tools filled in, which is the same for every run
+        def escape(value: str) -> str:
+            return value.replace('{', '{{').replace('}', '}}')
+        self._partial_prompt = self.prompt_template.replace(
+            '{tool_description}', escape(self._tool_description)
+        ).replace('{tool_names}', escape(self._tool_names))
+        question_index = self._partial_prompt.find('{question}')
+        if self.system_prompt and question_index != -1:
+            split_index = self._partial_prompt.rfind('\n', 0, question_index) + 1
+            self._system_template = self._partial_prompt[:split_index]
+            self._partial_prompt = self._partial_prompt[split_index:]
+
     @property
     def tool_description(self) -> str:
-        return "\n".join([f"{tool.name}: {tool.description}" for tool in self.tools])
+        return self._tool_description
 
     @property
     def tool_names(self) -> str:
-        return ",".join([tool.name for tool in self.tools])
+        return self._tool_names
 
     @property
     def tool_by_names(self) -> Dict[str, ToolInterface]:
-        return {tool.name: tool for tool in self.tools}
+        return self._tool_by_names
 
     def run(self, question: str):
-        previous_responses = []
+        transcript = io.StringIO()  # The previous responses, separated by newlines
+        steps = []
         num_loops = 0
-        prompt = self.prompt_template.format(
-                today = datetime.date.today(),
-                tool_description=self.tool_description,
-                tool_names=self.tool_names,
-                question=question,
-                previous_responses='{previous_responses}'
-        )
-        print(prompt.format(previous_responses=''))
+        if self.evaluate_arithmetic and (answer := _evaluate_arithmetic(question)) is not None:
+            return answer
+        system, prompt_prefix, prompt_suffix = self._prompt_parts(question)
+        while num_loops < self.max_loops:
+            num_loops += 1
+            curr_prompt = prompt_prefix + transcript.getvalue() + prompt_suffix
+            generated, actions = self.decide_next_actions(curr_prompt, system=system)
+            if actions[0][0] == 'Final Answer':
+                return actions[0][1]
+            tool_results = [self._tool(tool).use(tool_input) for tool, tool_input in actions]
+            generated += self._observations(tool_results)
+            print(generated)
+            transcript.write(('\n' if transcript.tell() else '') + generated)
+            steps.append(generated)
+            if self._should_compress(transcript, steps):
+                summary = self.llm.generate(self._summary_prompt(question, steps[:-2]))
+                steps = [self._summary_step(summary)] + steps[-2:]
+                transcript = self._transcript(steps)
+
+    async def arun(self, question: str):
+        transcript = io.StringIO()  # The previous responses, separated by newlines
+        steps = []
+        num_loops = 0
+        semaphore = asyncio.Semaphore(self.max_concurrent_tools)
+        if self.evaluate_arithmetic and (answer := _evaluate_arithmetic(question)) is not None:
+            return answer
+        system, prompt_prefix, prompt_suffix = self._prompt_parts(question)
         while num_loops < self.max_loops:
             num_loops += 1
-            curr_prompt = prompt.format(previous_responses='\n'.join(previous_responses))
-            generated, tool, tool_input = self.decide_next_action(curr_prompt)
-            if tool == 'Final Answer':
-                return tool_input
-            if tool not in self.tool_by_names:
-                raise ValueError(f"Unknown tool: {tool}")
-            tool_result = self.tool_by_names[tool].use(tool_input)
-            generated += f"\n{OBSERVATION_TOKEN} {tool_result}\n{THOUGHT_TOKEN}"
+            curr_prompt = prompt_prefix + transcript.getvalue() + prompt_suffix
+            generated, actions = await self.adecide_next_actions(curr_prompt, system=system)
+            if actions[0][0] == 'Final Answer':
+                return actions[0][1]
+            tools = [self._tool(tool) for tool, _ in actions]
+            tool_results = await asyncio.gather(*(
+                self._ause_tool(semaphore, tool, tool_input) for tool, (_, tool_input) in zip(tools, actions)
+            ))
+            generated += self._observations(tool_results)
             print(generated)
-            previous_responses.append(generated)
-
-    def decide_next_action(self, prompt: str) -> str:
-        generated = self.llm.generate(prompt, stop=self.stop_pattern)
-        tool, tool_input = self._parse(generated)
-        return generated, tool, tool_input
-
-    def _parse(self, generated: str) -> Tuple[str, str]:
-        if FINAL_ANSWER_TOKEN in generated:
-            return "Final Answer", generated.split(FINAL_ANSWER_TOKEN)[-1].strip()
-        regex = r"Action: [\[]?(.*?)[\]]?[\n]*Action Input:[\s]*(.*)"
-        match = re.search(regex, generated, re.DOTALL)
-        if not match:
+            transcript.write(('\n' if transcript.tell() else '') + generated)
+            steps.append(generated)
+            if self._should_compress(transcript, steps):
+                summary = await self.llm.agenerate(self._summary_prompt(question, steps[:-2]))
+                steps = [self._summary_step(summary)] + steps[-2:]
+                transcript = self._transcript(steps)
+
+    def run_many(self, questions: List[str], max_concurrent_runs: int = 64) -> List[str]:
+        """Run independent questions concurrently, so their LLM and tool calls overlap."""
+        async def run_all():
+            semaphore = asyncio.Semaphore(max_concurrent_runs)
+
+            async def run_one(question: str) -> str:
+                async with semaphore:
+                    return await self.arun(question)
+            async with pooled_session(), shared_client_session():
+                return await asyncio.gather(*(run_one(question) for question in questions))
+        return list(asyncio.run(run_all()))
+
+    def decide_next_actions(self, prompt: str, system: Optional[str] = None) -> Tuple[str, List[Tuple[str, str]]]:
+        generated = self.llm.generate(prompt, stop=self.stop_pattern, system=system)
+        return generated, self._parse_actions(generated)
+
+    async def adecide_next_actions(
+            self, prompt: str, system: Optional[str] = None
+    ) -> Tuple[str, List[Tuple[str, str]]]:
+        generated = await self.llm.agenerate(prompt, stop=self.stop_pattern, system=system)
+        return generated, self._parse_actions(generated)
+
+    def _prompt_parts(self, question: str) -> Tuple[Optional[str], str, str]:
+        system = None
+        if self._system_template is not None:
+            system = self._system_template.format(today=_today())
+            print(system)
+        prompt = self._partial_prompt.format(
+                today = _today(),
+                question=question,
+                previous_responses='{previous_responses}'
+        )
+        # Split once around the placeholder instead of re-formatting the whole prompt every loop
+        prompt_prefix, _, prompt_suffix = prompt.partition('{previous_responses}')
+        print(prompt_prefix + prompt_suffix)
+        return system, prompt_prefix, prompt_suffix
+
+    def _tool(self, tool: str) -> ToolInterface:
+        found = self._tool_by_names.get(tool)
+        if found is None:
+            raise ValueError(f"Unknown tool: {tool}")
+        return found
+
+    def _should_compress(self, transcript: io.StringIO, steps: List[str]) -> bool:
+        return self.max_context_chars is not None and transcript.tell() > self.max_context_chars and len(steps) > 2
+
+    @staticmethod
+    def _summary_prompt(question: str, steps: List[str]) -> str:
+        return (f"Summarize these steps, keeping all facts needed to answer the question: {question}\n"
+                + "\n".join(steps))
+
+    @staticmethod
+    def _summary_step(summary: str) -> str:
+        print(f"[Summary of earlier steps] {summary}")
+        return f"[Summary of earlier steps] {summary.strip()}\n{THOUGHT_TOKEN}"
+
+    @staticmethod
+    def _transcript(steps: List[str]) -> io.StringIO:
+        transcript = io.StringIO('\n'.join(steps))
+        transcript.seek(0, io.SEEK_END)
+        return transcript
+
+    @staticmethod
+    async def _ause_tool(semaphore: asyncio.Semaphore, tool: ToolInterface, tool_input: str) -> str:
+        async with semaphore:
+            return await tool.ause(tool_input)
+
+    @staticmethod
+    def _observations(tool_results: List[str]) -> str:
+        observations = "".join(f"\n{OBSERVATION_TOKEN} {tool_result}" for tool_result in tool_results)
+        return f"{observations}\n{THOUGHT_TOKEN}"
+
+    def _parse_actions(self, generated: str) -> List[Tuple[str, str]]:
+        final_answer_index = generated.rfind(FINAL_ANSWER_TOKEN)
+        if final_answer_index != -1:
+            return [("Final Answer", generated[final_answer_index + len(FINAL_ANSWER_TOKEN):].strip())]
+        # Scan forward for "Action:" lines followed by "Action Input:", either later on the same line
+        # or at the start of the next one. Each input runs until the next "Action:" line, or the end.
+        actions = []
+        action_index = generated.find(ACTION_TOKEN)
+        while action_index != -1:
+            line_end = generated.find("\n", action_index)
+            if line_end == -1:
+                line_end = len(generated)
+            tool_end = generated.find(ACTION_INPUT_TOKEN, action_index + len(ACTION_TOKEN), line_end)
+            if tool_end != -1:
+                input_index = tool_end
+            else:
+                tool_end = input_index = line_end
+                while generated.startswith("\n", input_index):
+                    input_index += 1
+                if not generated.startswith(ACTION_INPUT_TOKEN, input_index):
+                    action_index = generated.find(ACTION_TOKEN, line_end)
+                    continue
+            tool = generated[action_index + len(ACTION_TOKEN):tool_end].strip().strip("[]").strip()
+            input_index += len(ACTION_INPUT_TOKEN)
+            input_end = generated.find(f"\n{ACTION_TOKEN}", input_index)
+            tool_input = generated[input_index:input_end if input_end != -1 else len(generated)].lstrip()
+            actions.append((tool, tool_input.strip(" ").strip('"')))
+            action_index = input_end + 1 if input_end != -1 else -1
+        if not actions:
             raise ValueError(f"Output of LLM is not parsable for next tool use: `{generated}`")
-        tool = match.group(1).strip()
-        tool_input = match.group(2)
-        return tool, tool_input.strip(" ").strip('"')
+        return actions
 
 
 if __name__ == '__main__':
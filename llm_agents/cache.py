@@ -0,0 +1,268 @@
+import hashlib
+import orjson
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+
+class LLMCache:
+    """Interface for storing LLM responses (or tool results) by a content-addressed key."""
+
+    hits: int = 0
+    misses: int = 0
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError("get() method not implemented")  # Implement in subclass
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """Store value for ttl seconds, or the cache's default ttl if not given."""
+        raise NotImplementedError("set() method not implemented")  # Implement in subclass
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError("delete() method not implemented")  # Implement in subclass
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Like get(), but counts hits and misses."""
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+
+class InMemoryCache(LLMCache):
+    """Least recently used cache in process memory, whose entries expire after ttl seconds."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()  # Tools use the cache from worker threads
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisCache(LLMCache):
+    """Cache shared between processes in Redis. Needs the redis package."""
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: float = 3600, prefix: str = "llm_agents:"):
+        import redis  # Optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return None if value is None else value.decode("utf-8")
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.client.set(self.prefix + key, value.encode("utf-8"), ex=int(self.ttl if ttl is None else ttl))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+
+class DiskCache(LLMCache):
+    """Cache persisted as one JSON file per key, so it survives restarts of the process.
+
+    Files are sharded into sub-directories by the first two characters of the key.
+    """
+
+    def __init__(self, directory: str = "~/.llm_agents/cache", ttl: float = 7 * 24 * 3600):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with open(self._path(key), "rb") as f:
+                entry = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        if entry["expires_at"] < time.time():
+            self.delete(key)
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"expires_at": time.time() + (self.ttl if ttl is None else ttl), "value": value}
+        # Write to a temporary file first, so readers never see a partially written entry.
+        # It's unique per write, so concurrent writers of the same key don't clobber each other's file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(entry))
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class SQLiteCache(LLMCache):
+    """Cache persisted in a single SQLite database, so it survives restarts of the process.
+
+    Unlike DiskCache it needs only one file, and lookups don't touch the filesystem metadata.
+    Large values are stored zlib-compressed.
+    """
+
+    COMPRESS_MIN_BYTES = 1024
+
+    def __init__(self, path: str = "~/.llm_agents/cache.sqlite3", ttl: float = 7 * 24 * 3600):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connection() as connection:
+            # WAL lets readers run alongside a writer, and is kept in the database file
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """A connection for one operation, committed and closed afterwards.
+
+        Opening one is cheap in WAL mode, and the cache is used from short-lived worker threads,
+        which would otherwise leave their connections open.
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute("PRAGMA synchronous=NORMAL")  # Commits don't wait for an fsync
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._connection() as connection:
+            row = connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+        # Compressed values are stored as bytes, others as text
+        return zlib.decompress(value).decode("utf-8") if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        stored = value
+        if len(value) >= self.COMPRESS_MIN_BYTES:
+            stored = zlib.compress(value.encode("utf-8"))
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, stored, time.time() + (self.ttl if ttl is None else ttl)))
+
+    def delete(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class SemanticCache:
+    """Answers queries which are paraphrases of earlier ones, like "pope in 2023" for "Who was the pope in 2023?".
+
+    Queries are embedded as unit vectors, so a lookup is a single matrix-vector product over all
+    stored queries. Needs numpy, and sentence-transformers unless an embed function is given.
+    Similar queries can still ask for different things, so keep the threshold high.
+    """
+
+    def __init__(self, embed: Optional[Callable[[List[str]], Any]] = None, threshold: float = 0.9,
+                 max_size: int = 10_000, ttl: float = 3600, model_name: str = "all-MiniLM-L6-v2"):
+        import numpy  # Optional dependency, only needed for this cache
+        self._np = numpy
+        if embed is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+            embed = model.encode
+        self.embed = embed
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._vectors = None  # (n, dim) float32 array of unit vectors
+        self._expires_at = numpy.empty(0)
+        self._values: List[str] = []
+        self._last = (None, None)  # The last embedded query, as add() usually follows a missed lookup
+        self._lock = threading.Lock()
+
+    def _vector(self, query: str):
+        last_query, last_vector = self._last
+        if query == last_query:
+            return last_vector
+        vector = self._np.asarray(self.embed([query]), dtype=self._np.float32)[0]
+        vector /= self._np.linalg.norm(vector) or 1.0
+        self._last = (query, vector)
+        return vector
+
+    def lookup(self, query: str) -> Optional[str]:
+        with self._lock:
+            if not self._values:
+                return None
+            similarities = self._vectors @ self._vector(query)
+            similarities[self._expires_at < time.monotonic()] = -1.0
+            best = int(similarities.argmax())
+            return self._values[best] if similarities[best] >= self.threshold else None
+
+    def add(self, query: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            vector = self._vector(query)[None, :]
+            expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+            if self._vectors is None:
+                self._vectors = vector
+            else:
+                # Drop the oldest entries to make room
+                start = max(0, len(self._values) + 1 - self.max_size)
+                self._vectors = self._np.vstack([self._vectors[start:], vector])
+                self._expires_at = self._expires_at[start:]
+                self._values = self._values[start:]
+            self._expires_at = self._np.append(self._expires_at, expires_at)
+            self._values.append(value)
+
+
+def hash_key(*parts: str) -> str:
+    """Content-addressed key for a tuple of strings."""
+    return hashlib.sha256(orjson.dumps(parts)).hexdigest()
+
+
+def request_key(request: dict) -> str:
+    """Hash of everything that determines the response to a chat completion request."""
+    payload = {
+        "model": request["model"],
+        "temperature": request["temperature"],
+        "stop": sorted(request["stop"] or []),
+        "messages": request["messages"],
+    }
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
@@ -1,23 +1,157 @@
+import aiohttp
+import asyncio
 import openai
 import os
+import weakref
 
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from typing import List
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from typing import Callable, Dict, List, Optional
+from llm_agents.cache import LLMCache, request_key
+
+
+# Transient OpenAI errors, like rate limits, which are worth retrying with backoff
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError,
+)
+RETRY = retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    reraise=True
+)
+# Cap on in-flight async requests shared by all agents, so concurrent runs don't hammer the rate limit
+MAX_CONCURRENT_REQUESTS = 8
+# asyncio semaphores are bound to a loop, so keep one per running event loop
+_SEMAPHORES = weakref.WeakKeyDictionary()
+
+
+def _request_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _SEMAPHORES:
+        _SEMAPHORES[loop] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return _SEMAPHORES[loop]
+
+
+# Running requests by key, so identical concurrent requests can await the same one
+_IN_FLIGHT = weakref.WeakKeyDictionary()
+
+
+def _in_flight_requests() -> Dict[str, asyncio.Future]:
+    loop = asyncio.get_running_loop()
+    if loop not in _IN_FLIGHT:
+        _IN_FLIGHT[loop] = {}
+    return _IN_FLIGHT[loop]
+
+
+# Only opening the stream is retried: once tokens have been passed to on_token, a retry would repeat them
+@RETRY
+def _open_stream(request: dict):
+    return openai.ChatCompletion.create(**request)
+
+
+@RETRY
+async def _aopen_stream(request: dict):
+    return await openai.ChatCompletion.acreate(**request)
+
+
+@asynccontextmanager
+async def pooled_session():
+    """Share one aiohttp session between all async OpenAI requests made inside this context.
+
+    The sync client already keeps a requests session per thread, but without this
+    every async request opens and closes its own connection.
+    """
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=20)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = openai.aiosession.set(session)
+        try:
+            yield session
+        finally:
+            openai.aiosession.reset(token)
 
 
 class ChatLLM(BaseModel):
     model: str = 'gpt-3.5-turbo'
     temperature: float = 0.0
+    # Responses are only cached at temperature 0, where they are deterministic
+    cache: Optional[LLMCache] = None
+    # Called with each piece of text as it streams in, e.g. to show the agent's progress live
+    on_token: Optional[Callable[[str], None]] = None
     openai.api_key = os.environ["OPENAI_API_KEY"]  # Credentials setup
 
-    def generate(self, prompt: str, stop: List[str] = None):
-        response = openai.ChatCompletion.create(
+    class Config:
+        arbitrary_types_allowed = True
+
+    def generate(self, prompt: str, stop: List[str] = None, system: Optional[str] = None):
+        request = self._request(prompt, stop, system)
+        key = self._deterministic_key(request) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.lookup(key)
+            if cached is not None:
+                self._emit(cached)
+                return cached
+        generated = self._complete(request)
+        if key is not None:
+            self.cache.set(key, generated)
+        return generated
+
+    async def agenerate(self, prompt: str, stop: List[str] = None, system: Optional[str] = None):
+        request = self._request(prompt, stop, system)
+        key = self._deterministic_key(request)
+        if key is not None and self.cache is not None:
+            cached = self.cache.lookup(key)
+            if cached is not None:
+                self._emit(cached)
+                return cached
+        if key is None:
+            return await self._acomplete(request)
+        # Concurrent identical requests share a single API call
+        in_flight = _in_flight_requests()
+        if key not in in_flight:
+            in_flight[key] = asyncio.ensure_future(self._acomplete(request))
+            in_flight[key].add_done_callback(lambda _: in_flight.pop(key, None))
+        generated = await asyncio.shield(in_flight[key])
+        if self.cache is not None:
+            self.cache.set(key, generated)
+        return generated
+
+    def _complete(self, request: dict) -> str:
+        response = _open_stream(request)
+        return "".join(self._emit(chunk.choices[0].delta.get("content", "")) for chunk in response)
+
+    async def _acomplete(self, request: dict) -> str:
+        async with _request_semaphore():
+            response = await _aopen_stream(request)
+            return "".join([self._emit(chunk.choices[0].delta.get("content", "")) async for chunk in response])
+
+    def _emit(self, text: str) -> str:
+        if text and self.on_token is not None:
+            self.on_token(text)
+        return text
+
+    def _deterministic_key(self, request: dict) -> Optional[str]:
+        """Key identifying the response, None when sampling makes it non-deterministic."""
+        if self.temperature > 0:
+            return None
+        return request_key(request)
+
+    def _request(self, prompt: str, stop: List[str] = None, system: Optional[str] = None) -> dict:
+        messages = [{"role": "user", "content": prompt}]
+        if system is not None:
+            messages.insert(0, {"role": "system", "content": system})
+        # Stream the tokens, the API ends the stream as soon as a stop sequence is generated
+        return dict(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=messages,
             temperature=self.temperature,
-            stop=stop
+            stop=stop,
+            stream=True
         )
-        return response.choices[0].message.content
 
 if __name__ == '__main__':
     llm = ChatLLM()
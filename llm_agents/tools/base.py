@@ -1,8 +1,150 @@
+import aiohttp
+import asyncio
+import functools
+import orjson
+import weakref
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
 from pydantic import BaseModel
+from typing import Callable, ClassVar, Dict, List, Optional
+from llm_agents.cache import InMemoryCache, LLMCache, SemanticCache, hash_key
+
 
 class ToolInterface(BaseModel):
     name: str
     description: str
-    
+    # Results of use() are memoized per (tool name, input) for cache_ttl seconds,
+    # which should match how quickly the tool's answers go stale.
+    # Stateful tools should set cacheable to False.
+    cacheable: bool = True
+    cache_ttl: float = 300.0
+    cache_key_fn: Optional[Callable[[str], str]] = None
+    # Also reuse results for paraphrased inputs, checked after the exact result_cache misses
+    semantic_cache: Optional[SemanticCache] = None
+
+    # Shared by all tools. Set it to e.g. a DiskCache to keep results across restarts.
+    result_cache: ClassVar[LLMCache] = InMemoryCache(max_size=1024)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "use" in cls.__dict__:
+            cls.use = _memoize_use(cls.__dict__["use"])
+        if "ause" in cls.__dict__:
+            cls.ause = _memoize_ause(cls.__dict__["ause"])
+
     def use(self, input_text: str) -> str:
         raise NotImplementedError("use() method not implemented")  # Implement in subclass
+
+    async def ause(self, input_text: str) -> str:
+        # Blocking tools run in a worker thread, so they don't stall other agents on the event loop
+        return await asyncio.to_thread(self.use, input_text)
+
+    def use_many(self, input_texts: List[str]) -> List[str]:
+        """Use the tool for several independent inputs concurrently, returning the results in order."""
+        async def use_all():
+            async with shared_client_session():
+                return await asyncio.gather(*(self.ause(input_text) for input_text in input_texts))
+        return list(asyncio.run(use_all()))
+
+    def _cache_key(self, input_text: str) -> str:
+        key = self.cache_key_fn(input_text) if self.cache_key_fn else input_text.strip()
+        # Differently configured instances of a tool, e.g. with and without crawl_urls, give different results
+        config = orjson.dumps(self.dict(exclude=_NON_CONFIG_FIELDS), default=repr, option=orjson.OPT_SORT_KEYS)
+        # The class too, as different tools can share a display name, like SerpAPITool and GoogleSearchTool
+        tool_class = f"{type(self).__module__}.{type(self).__qualname__}"
+        return hash_key(tool_class, self.name, config.decode(), key)
+
+    def _cached(self, key: str, input_text: str) -> Optional[str]:
+        cached = self.result_cache.lookup(key)
+        if cached is None and self.semantic_cache is not None:
+            cached = self.semantic_cache.lookup(input_text.strip())
+        return cached
+
+    def _store(self, key: str, input_text: str, result: str) -> None:
+        self.result_cache.set(key, result, ttl=self.cache_ttl)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(input_text.strip(), result, ttl=self.cache_ttl)
+
+
+# Fields which don't change a tool's results, so they are left out of its cache keys
+_NON_CONFIG_FIELDS = {"name", "description", "cacheable", "cache_ttl", "cache_key_fn", "semantic_cache"}
+
+
+# Running async tool calls by cache key, per event loop, so identical concurrent calls can await the same one
+_IN_FLIGHT = weakref.WeakKeyDictionary()
+
+
+def _in_flight_calls() -> Dict[str, asyncio.Future]:
+    loop = asyncio.get_running_loop()
+    if loop not in _IN_FLIGHT:
+        _IN_FLIGHT[loop] = {}
+    return _IN_FLIGHT[loop]
+
+
+# The aiohttp session shared by async tool requests inside shared_client_session()
+_CLIENT_SESSION: ContextVar[Optional[aiohttp.ClientSession]] = ContextVar("client_session", default=None)
+
+
+@asynccontextmanager
+async def shared_client_session():
+    """Share one aiohttp session between all async tool requests made inside this context,
+    so they reuse their connections. The session is closed when the context exits.
+    """
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=16)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = _CLIENT_SESSION.set(session)
+        try:
+            yield session
+        finally:
+            _CLIENT_SESSION.reset(token)
+
+
+@asynccontextmanager
+async def client_session():
+    """The session of the enclosing shared_client_session(), or else one just for this request."""
+    session = _CLIENT_SESSION.get()
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession() as session:
+        yield session
+
+
+def _memoize_use(use):
+    @functools.wraps(use)
+    def wrapper(self: ToolInterface, input_text: str) -> str:
+        if not self.cacheable:
+            return use(self, input_text)
+        key = self._cache_key(input_text)
+        cached = self._cached(key, input_text)
+        if cached is not None:
+            return cached
+        result = use(self, input_text)
+        self._store(key, input_text, result)
+        return result
+    return wrapper
+
+
+def _memoize_ause(ause):
+    @functools.wraps(ause)
+    async def wrapper(self: ToolInterface, input_text: str) -> str:
+        if not self.cacheable:
+            return await ause(self, input_text)
+        key = self._cache_key(input_text)
+        cached = self._cached(key, input_text)
+        if cached is not None:
+            return cached
+        # Concurrent calls with the same input, e.g. from parallel agents, share a single search
+        in_flight = _in_flight_calls()
+        if key not in in_flight:
+            in_flight[key] = asyncio.ensure_future(ause(self, input_text))
+            in_flight[key].add_done_callback(lambda _: in_flight.pop(key, None))
+        result = await asyncio.shield(in_flight[key])
+        self._store(key, input_text, result)
+        return result
+    return wrapper
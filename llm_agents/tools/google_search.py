@@ -1,9 +1,14 @@
 # Based on https://raw.githubusercontent.com/hwchase17/langchain/master/langchain/utilities/google_search.py
 
+import aiohttp
+import asyncio
+import orjson
 import os
 from typing import Any
-from llm_agents.tools.base import ToolInterface
-from googleapiclient.discovery import build
+from llm_agents.tools.base import ToolInterface, client_session, shared_client_session
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 """Wrapper for Google Search API.
@@ -12,12 +17,10 @@ Adapted from: Instructions adapted from https://stackoverflow.com/questions/
 37083058/
 programmatically-searching-google-in-python-using-custom-search
 
-1. Install google-api-python-client
+1. Create a project
 - If you don't already have a Google account, sign up.
 - If you have never created a Google APIs Console project,
 read the Managing Projects page and create a project in the Google API Console.
-- Install the library using pip install google-api-python-client
-The current version of the library is 2.70.0 at this time
 
 2. To create an API key:
 - Navigate to the APIs & Services→Credentials panel in Cloud Console.
@@ -44,30 +47,67 @@ URL for it: https://console.cloud.google.com/apis/library/customsearch.googleapi
 """
 
 
-def _google_search_results(params) -> list[dict[str, Any]]:
-    service = build("customsearch", "v1", developerKey=params['api_key'])
-    res = service.cse().list(
-        q=params['q'], cx=params['cse_id'], num=params['max_results']).execute()
-    return res.get('items', [])
+# Credentials are read once. If they are set after import, search() looks them up on each call.
+_CSE_ID = os.environ.get("GOOGLE_CSE_ID")
+_API_KEY = os.environ.get("GOOGLE_API_KEY")
+MAX_RESULTS = 10
 
+# The Custom Search JSON API. Calling it directly skips the discovery document, which
+# google-api-python-client would fetch and parse before the first search.
+ENDPOINT = "https://www.googleapis.com/customsearch/v1"
+TIMEOUT = (3, 10)  # (connect, read) in seconds
+_ASYNC_TIMEOUT = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
 
-def search(query: str) -> str:
-    params: dict = {
-        "q": query,
-        "cse_id": os.environ["GOOGLE_CSE_ID"],
-        "api_key": os.environ["GOOGLE_API_KEY"],
-        "max_results": 10
-    }
-
-    res = _google_search_results(params)
-    snippets = []
+# Shared session, so consecutive searches reuse the connection to the API
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2))
+_SESSION.mount("https://", _ADAPTER)
+
+
+def _request_params(query: str, cse_id: str, api_key: str, max_results: int) -> dict[str, Any]:
+    return {"q": query, "cx": cse_id, "key": api_key, "num": max_results}
+
+
+def _google_search_results(query: str, cse_id: str, api_key: str, max_results: int) -> list[dict[str, Any]]:
+    res = _SESSION.get(ENDPOINT, params=_request_params(query, cse_id, api_key, max_results), timeout=TIMEOUT)
+    res.raise_for_status()
+    return orjson.loads(res.content).get('items', [])
+
+
+async def _google_search_results_async(query: str, cse_id: str, api_key: str, max_results: int) -> list[dict[str, Any]]:
+    params = _request_params(query, cse_id, api_key, max_results)
+    async with client_session() as session:
+        async with session.get(ENDPOINT, params=params, timeout=_ASYNC_TIMEOUT) as res:
+            res.raise_for_status()
+            return orjson.loads(await res.read()).get('items', [])
+
+
+def _process_results(res: list[dict[str, Any]]) -> str:
     if len(res) == 0:
         return "No good Google Search Result was found"
-    for result in res:
-        if "snippet" in result:
-            snippets.append(result["snippet"])
+    return " ".join(result["snippet"] for result in res if "snippet" in result)
 
-    return " ".join(snippets)
+
+def _credentials() -> tuple[str, str]:
+    return _CSE_ID or os.environ["GOOGLE_CSE_ID"], _API_KEY or os.environ["GOOGLE_API_KEY"]
+
+
+def search(query: str) -> str:
+    return _process_results(_google_search_results(query, *_credentials(), MAX_RESULTS))
+
+
+async def asearch(query: str) -> str:
+    """Like search(), but doesn't block the event loop while waiting for the API."""
+    res = await _google_search_results_async(query, *_credentials(), MAX_RESULTS)
+    return _process_results(res)
+
+
+def search_many(queries: list[str]) -> list[str]:
+    """Run several searches concurrently, so they take as long as the slowest one instead of the sum."""
+    async def search_all():
+        async with shared_client_session():
+            return await asyncio.gather(*(asearch(query) for query in queries))
+    return list(asyncio.run(search_all()))
 
 
 class GoogleSearchTool(ToolInterface):
@@ -75,10 +115,14 @@ class GoogleSearchTool(ToolInterface):
 
     name = "Google Search"
     description = "Get specific information from a search query. Input should be a question like 'How to add number in Clojure?'. Result will be the answer to the question."
+    cache_ttl = 3600.0  # Web search results change slowly
 
     def use(self, input_text: str) -> str:
         return search(input_text)
 
+    async def ause(self, input_text: str) -> str:
+        return await asearch(input_text)
+
 
 if __name__ == '__main__':
     s = GoogleSearchTool()
@@ -1,18 +1,65 @@
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from llm_agents.tools.base import ToolInterface
 
 
 ENDPOINT = "https://hn.algolia.com/api/v1/search_by_date"
+MAX_HITS = 5
+TIMEOUT = (3, 10)  # (connect, read) in seconds
+# Markup, scripts and styles take up most of a page, so read well past max_len bytes before extracting the text
+CRAWL_BYTES_PER_CHAR = 16
 
+# Shared session, so consecutive requests to the same host reuse their connection
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=2, backoff_factor=0.1))
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
 
-def extract_text_from(url, max_len: int = 2000):
-    html = requests.get(url).text
-    soup = BeautifulSoup(html, features="html.parser")
-    text = soup.get_text()
 
-    lines = (line.strip() for line in text.splitlines())
-    return '\n'.join(line for line in lines if line)[:max_len]
+def extract_text_from(url, max_len: int = 2000):
+    html = _download_head(url, max_len * CRAWL_BYTES_PER_CHAR)
+    if not html.strip():
+        return ""
+    # lxml parses in C, which is much faster than BeautifulSoup's pure-Python html.parser.
+    # It's only imported when a page is actually crawled.
+    import lxml.etree
+    import lxml.html
+    try:
+        # Parsing the bytes lets lxml honor the page's own charset and XML declaration
+        tree = lxml.html.fromstring(html)
+    except lxml.etree.ParserError:
+        return ""  # E.g. a body without any elements
+    # text_content() includes the code of scripts and styles, which isn't text of the page
+    for element in tree.xpath('//script|//style|//noscript'):
+        element.drop_tree()
+    text = tree.text_content()
+
+    # Keep non-empty lines, stopping as soon as there is enough text
+    lines = []
+    length = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        lines.append(line)
+        length += len(line) + 1
+        if length >= max_len:
+            break
+    return '\n'.join(lines)[:max_len]
+
+
+def _download_head(url: str, max_bytes: int) -> bytes:
+    """Download only the first max_bytes of a page instead of the whole body."""
+    content = bytearray()
+    with _SESSION.get(url, timeout=TIMEOUT, stream=True) as response:
+        for chunk in response.iter_content(chunk_size=8192):
+            content += chunk
+            if len(content) >= max_bytes:
+                break
+    return bytes(content[:max_bytes])
 
 
 def search_hn(query: str, crawl_urls: bool) -> str:
@@ -22,25 +69,29 @@ def search_hn(query: str, crawl_urls: bool) -> str:
         "numericFilters": "points>100"
     }
 
-    response = requests.get(ENDPOINT, params=params)
-
-    hits = response.json()["hits"]
-
-    result = ""
-    for hit in hits[:5]:
-        title = hit["title"]
-        url = hit["url"]
-        result += f"Title: {title}\n"
-        
-        if url is not None and crawl_urls:
-            result += f"\tExcerpt: {extract_text_from(url)}\n"
-        else:
-            objectID = hit["objectID"]
-            comments_url = f"{ENDPOINT}?tags=comment,story_{objectID}&hitsPerPage=1"
-            comments_response = requests.get(comments_url)
-            comment = comments_response.json()["hits"][0]['comment_text']
-            
-            result += f"\tComment: {comment}\n"
+    response = _SESSION.get(ENDPOINT, params=params, timeout=TIMEOUT)
+
+    hits = orjson.loads(response.content)["hits"]
+
+    # The per-hit fetches are independent, so run them concurrently and keep the hit order
+    with ThreadPoolExecutor(max_workers=MAX_HITS) as pool:
+        return "".join(pool.map(lambda hit: _summarize_hit(hit, crawl_urls), hits[:MAX_HITS]))
+
+
+def _summarize_hit(hit: dict, crawl_urls: bool) -> str:
+    title = hit["title"]
+    url = hit["url"]
+    result = f"Title: {title}\n"
+
+    if url is not None and crawl_urls:
+        result += f"\tExcerpt: {extract_text_from(url)}\n"
+    else:
+        objectID = hit["objectID"]
+        comments_url = f"{ENDPOINT}?tags=comment,story_{objectID}&hitsPerPage=1"
+        comments_response = _SESSION.get(comments_url, timeout=TIMEOUT)
+        comment = orjson.loads(comments_response.content)["hits"][0]['comment_text']
+
+        result += f"\tComment: {comment}\n"
     return result
 
 
@@ -49,6 +100,7 @@ class HackerNewsSearchTool(ToolInterface):
 
     name = "hacker news search"
     description = "Get insight from hacker news users to specific search terms. Input should be a search term (e.g. How to get rich?). The output will be the most recent stories related to it with a user comment."
+    cache_ttl = 600.0  # New stories and comments come in all the time
     crawl_urls = False
 
     def use(self, input_text: str) -> str:
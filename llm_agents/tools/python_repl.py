@@ -1,34 +1,113 @@
+import asyncio
+import builtins
+import json
+import math
+import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from functools import lru_cache
 from io import StringIO
 from typing import Dict, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import Field
 from llm_agents.tools.base import ToolInterface
 
 
 # Taken from https://github.com/hwchase17/langchain/blob/master/langchain/python.py
-class PythonREPL(BaseModel):
+# A plain slotted class rather than a pydantic model: it only holds the namespaces for exec,
+# so validation buys nothing on a path the agent loop hits repeatedly.
+class PythonREPL:
     """Simulates a standalone Python REPL."""
 
-    globals: Optional[Dict] = Field(default_factory=dict, alias="_globals")
-    locals: Optional[Dict] = Field(default_factory=dict, alias="_locals")
+    __slots__ = ("globals", "locals")
+
+    def __init__(self, _globals: Optional[Dict] = None, _locals: Optional[Dict] = None):
+        """Without _locals, commands run at module level directly in the globals."""
+        self.globals = {} if _globals is None else _globals
+        self.locals = _locals
 
     def run(self, command: str) -> str:
         """Run command with own globals/locals and returns anything printed."""
-        old_stdout = sys.stdout
-        sys.stdout = mystdout = StringIO()
+        output = StringIO()
         try:
-            exec(command, self.globals, self.locals)
-            sys.stdout = old_stdout
-            output = mystdout.getvalue()
+            with redirect_stdout(output):
+                exec(_compile(command), self.globals, self.locals)
         except Exception as e:
-            sys.stdout = old_stdout
-            output = str(e)
-        return output
+            # Keep what was printed before the error, it often shows how far the code got
+            return f"{output.getvalue()}{e}"
+        return output.getvalue()
+
+
+@lru_cache(maxsize=128)
+def _compile(command: str):
+    """Compile a command once, so repeated snippets skip the parser and compiler."""
+    return compile(command, "<repl>", "exec")
+
+
+# A markdown code block, optionally with a language tag like ```python and possibly unclosed
+_FENCE_RE = re.compile(r"^```(?:[\w+-]+\n)?(.*?)(?:```)?\s*$", re.DOTALL)
+
+
+def _strip_fence(text: str) -> str:
+    """Return the code inside a markdown code block, or the text itself if it isn't one."""
+    if not text.startswith("```"):
+        return text
+    # Fast path for the usual closed block with an optional language tag on its own line
+    newline = text.find("\n")
+    if newline != -1 and text.endswith("```") and _is_language_tag(text[3:newline]):
+        return text[newline + 1:-3].strip()
+    return _FENCE_RE.match(text).group(1).strip()
+
+
+def _is_language_tag(line: str) -> bool:
+    """Whether the first line of a code block is a language tag like python or c++, as _FENCE_RE allows."""
+    return not line or line.replace("+", "").replace("-", "").replace("_", "").isalnum()
+
+
+# Modules commands commonly need, bound in every new REPL so commands can skip the imports
+_PRELUDE = {"__builtins__": builtins, "json": json, "math": math, "os": os, "re": re, "time": time}
 
 
 def _get_default_python_repl() -> PythonREPL:
-    return PythonREPL(_globals=globals(), _locals=None)
+    # A copy of the prelude, so commands can't change it or this module's globals
+    return PythonREPL(_globals=dict(_PRELUDE), _locals=None)
+
+
+# Worker processes for isolated commands, created on first use
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        kwargs = {}
+        if sys.version_info >= (3, 11):
+            # Recycle workers, so memory held by old commands is given back
+            kwargs["max_tasks_per_child"] = 32
+        _EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count(), **kwargs)
+    return _EXECUTOR
+
+
+def _run_in_child(command: str) -> str:
+    """Run a command in a fresh REPL inside a worker process."""
+    try:
+        return _get_default_python_repl().run(command)
+    except SystemExit as e:
+        # Don't let sys.exit() in the command take down the worker or get re-raised in the agent
+        return f"SystemExit: {e.code}"
+
+
+def _broken_pool_message(executor: ProcessPoolExecutor) -> str:
+    # A worker died, e.g. from a segfault. Release the broken pool and start a new one for the next command.
+    global _EXECUTOR
+    if _EXECUTOR is executor:
+        _EXECUTOR = None
+        executor.shutdown(wait=False, cancel_futures=True)
+    return "The Python process running the command crashed"
 
 
 class PythonREPLTool(ToolInterface):
@@ -42,10 +121,37 @@ class PythonREPLTool(ToolInterface):
         "with `print(...)`."
     )
     python_repl: PythonREPL = Field(default_factory=_get_default_python_repl)
+    # The REPL keeps state between commands, so the same input can give a different output
+    cacheable: bool = False
+    # Run each command in a fresh namespace in a worker process instead. Commands then run in
+    # parallel and a crash can't take down the agent, but nothing is kept between commands.
+    # By default (None) only ause() isolates, so async agents aren't stalled by a slow command.
+    # False keeps the shared REPL for ause() too, which then blocks the event loop while it runs.
+    isolated: Optional[bool] = None
+
+    class Config:
+        arbitrary_types_allowed = True
 
     def use(self, input_text: str) -> str:
-        input_text = input_text.strip().strip("```")
-        return self.python_repl.run(input_text)
+        command = _strip_fence(input_text.strip())
+        if not self.isolated:  # None or False
+            return self.python_repl.run(command)
+        executor = _get_executor()
+        try:
+            return executor.submit(_run_in_child, command).result()
+        except BrokenProcessPool:
+            return _broken_pool_message(executor)
+
+    async def ause(self, input_text: str) -> str:
+        if self.isolated is False:
+            # Run inline: redirect_stdout swaps the process-wide sys.stdout, which is unsafe from a worker thread
+            return self.python_repl.run(_strip_fence(input_text.strip()))
+        command = _strip_fence(input_text.strip())
+        executor = _get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, _run_in_child, command)
+        except BrokenProcessPool:
+            return _broken_pool_message(executor)
 
 
 if __name__ == '__main__':
@@ -1,74 +1,59 @@
 # Based on https://github.com/hwchase17/langchain/blob/master/langchain/utilities/serpapi.py
 
+import orjson
 import os
-import sys
-from typing import Any
+import requests
 
 from llm_agents.tools.base import ToolInterface
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from serpapi import GoogleSearch
+
+# The SerpAPI endpoint, called directly instead of through the client library,
+# which prints to stdout and so had to be silenced with a process-wide redirect
+ENDPOINT = "https://serpapi.com/search.json"
+TIMEOUT = (3, 30)  # (connect, read) in seconds, SerpAPI can take a while to scrape the results
+
+# Shared session, so consecutive searches reuse the connection to SerpAPI
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2))
+_SESSION.mount("https://", _ADAPTER)
+
+BASE_PARAMS = {
+    "engine": "google",
+    "google_domain": "google.com",
+    "gl": "us",
+    "hl": "en",
+}
 
 
 def search(query: str) -> str:
-    params: dict = {
-        "engine": "google",
-        "google_domain": "google.com",
-        "gl": "us",
-        "hl": "en",
-        "q": query,
-        "api_key": os.environ["SERPAPI_API_KEY"]
-    }
+    params: dict = {**BASE_PARAMS, "q": query, "api_key": os.environ["SERPAPI_API_KEY"]}
+    # Errors come back as JSON with an "error" field, which _process_response raises
+    res = _SESSION.get(ENDPOINT, params=params, timeout=TIMEOUT)
+    return _process_response(orjson.loads(res.content))
 
-    with HiddenPrints():
-        search = GoogleSearch(params)
-        res = search.get_dict()
 
-    return _process_response(res)
+# Ordered (section, field, extractor) candidates, the first one present in the response wins
+_ANSWER_EXTRACTORS = [
+    ("answer_box", "answer", lambda value: value),
+    ("answer_box", "snippet", lambda value: value),
+    ("answer_box", "snippet_highlighted_words", lambda value: value[0]),
+    ("sports_results", "game_spotlight", lambda value: value),
+    ("knowledge_graph", "description", lambda value: value),
+]
 
 
 def _process_response(res: dict) -> str:
     """Process response from SerpAPI."""
-    if "error" in res.keys():
+    if "error" in res:
         raise ValueError(f"Got error from SerpAPI: {res['error']}")
-    if "answer_box" in res.keys() and "answer" in res["answer_box"].keys():
-        toret = res["answer_box"]["answer"]
-    elif "answer_box" in res.keys() and "snippet" in res["answer_box"].keys():
-        toret = res["answer_box"]["snippet"]
-    elif (
-        "answer_box" in res.keys()
-        and "snippet_highlighted_words" in res["answer_box"].keys()
-    ):
-        toret = res["answer_box"]["snippet_highlighted_words"][0]
-    elif (
-        "sports_results" in res.keys()
-        and "game_spotlight" in res["sports_results"].keys()
-    ):
-        toret = res["sports_results"]["game_spotlight"]
-    elif (
-        "knowledge_graph" in res.keys()
-        and "description" in res["knowledge_graph"].keys()
-    ):
-        toret = res["knowledge_graph"]["description"]
-    elif "snippet" in res["organic_results"][0].keys():
-        toret = res["organic_results"][0]["snippet"]
-
-    else:
-        toret = "No good search result found"
-    return toret
-
-
-class HiddenPrints:
-    """Context manager to hide prints."""
-
-    def __enter__(self) -> None:
-        """Open file to pipe stdout to."""
-        self._original_stdout = sys.stdout
-        sys.stdout = open(os.devnull, "w")
-
-    def __exit__(self, *_: Any) -> None:
-        """Close file that stdout was piped to."""
-        sys.stdout.close()
-        sys.stdout = self._original_stdout
+    for section, field, extract in _ANSWER_EXTRACTORS:
+        values = res.get(section)
+        if values and field in values:
+            return extract(values[field])
+    organic_results = res.get("organic_results") or [{}]
+    return organic_results[0].get("snippet", "No good search result found")
 
 
 class SerpAPITool(ToolInterface):
@@ -76,9 +61,10 @@ class SerpAPITool(ToolInterface):
 
     name = "Google Search"
     description = "Get specific information from a search query. Input should be a  question like 'How to add number in Clojure?'. Result will be the answer to the question."
+    cache_ttl = 3600.0  # Web search results change slowly
 
     def use(self, input_text: str) -> str:
-        return search(input_text) 
+        return search(input_text)
 
 
 if __name__ == '__main__':
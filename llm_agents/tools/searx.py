@@ -1,8 +1,12 @@
+import aiohttp
+import asyncio
+import orjson
 import os
 from typing import Any
-from llm_agents.tools.base import ToolInterface
+from llm_agents.tools.base import ToolInterface, client_session, shared_client_session
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 """
 Wrapper for the Searx Search API
@@ -17,8 +21,19 @@ https://searx.github.io/searx/dev/search_api.html
 Set the URL of the Searx instance to the environment variable SEARX_INSTANCE_URL.
 """
 
+TIMEOUT = (3, 10)  # (connect, read) in seconds
+_ASYNC_TIMEOUT = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+# Read once. If it is set after import, it is looked up on each search instead.
+_INSTANCE_URL = os.environ.get("SEARX_INSTANCE_URL")
 
-def _searx_search_results(params) -> list[dict[str, Any]]:
+# Shared session, so consecutive searches reuse the connection to the Searx instance
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2))
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+
+def _search_params(params) -> dict[str, Any]:
     search_params = {
         "q": params['q'],
         "safesearch": 0,
@@ -27,48 +42,65 @@ def _searx_search_results(params) -> list[dict[str, Any]]:
 
     if params['safesearch']:
         search_params['safesearch'] = 1
+    return search_params
 
-    res = requests.post(params['instance_url'], data=search_params)
-    json_results = json.loads(res.content)
-    return json_results
 
+def _searx_search_results(params) -> list[dict[str, Any]]:
+    res = _SESSION.post(params['instance_url'], data=_search_params(params), timeout=TIMEOUT)
+    return orjson.loads(res.content)
 
-def search(query: str) -> str:
-    params: dict = {
+
+async def _searx_search_results_async(params) -> list[dict[str, Any]]:
+    async with client_session() as session:
+        async with session.post(params['instance_url'], data=_search_params(params), timeout=_ASYNC_TIMEOUT) as res:
+            return orjson.loads(await res.read())
+
+
+def _params(query: str) -> dict[str, Any]:
+    return {
         "q": query,
-        "instance_url": os.environ["SEARX_INSTANCE_URL"],
+        "instance_url": _INSTANCE_URL or os.environ["SEARX_INSTANCE_URL"],
         "method": "POST",
         "safesearch": False,
         "max_results": 10
     }
 
+
+def search(query: str) -> str:
+    params = _params(query)
     res = _searx_search_results(params)
+    return _process_results(res, params['max_results'])
+
 
-    if (len(res) == 0 or (len(res['answers']) == 0 and len(res['infoboxes']) == 0 and len(res['results']) == 0)):
-        return "No good Searx Search Result was found"
+async def asearch(query: str) -> str:
+    """Like search(), but doesn't block the event loop while waiting for the Searx instance."""
+    params = _params(query)
+    res = await _searx_search_results_async(params)
+    return _process_results(res, params['max_results'])
 
-    toret = []
 
-    if len(res['answers']) > 0:
-        for result in res['answers']:
-            if "content" in result:
-                toret.append(result["content"])
+NOT_FOUND = "No good Searx Search Result was found"
+# Sections of the response by priority, and whether only max_results of them are used.
+# Answers are the most direct, then infoboxes, then the plain results.
+_SECTIONS = (('answers', False), ('infoboxes', False), ('results', True))
 
-    elif len(res['infoboxes']) > 0:
-        for result in res['infoboxes']:
-            if "content" in result:
-                toret.append(result["content"])
 
-    elif len(res['results']) > 0:
-        for result in res['results'][:params['max_results']]:
-            if "content" in result:
-                toret.append(result["content"])
+def _process_results(res: dict[str, Any], max_results: int) -> str:
+    for section, limited in _SECTIONS:
+        bucket = res.get(section)
+        if bucket:
+            if limited:
+                bucket = bucket[:max_results]
+            return " ".join(result["content"] for result in bucket if "content" in result) or NOT_FOUND
+    return NOT_FOUND
 
-    for result in res:
-        if "content" in result:
-            toret.append(result["content"])
 
-    return " ".join(toret)
+def search_many(queries: list[str]) -> list[str]:
+    """Run several searches concurrently, so they take as long as the slowest one instead of the sum."""
+    async def search_all():
+        async with shared_client_session():
+            return await asyncio.gather(*(asearch(query) for query in queries))
+    return list(asyncio.run(search_all()))
 
 
 class SearxSearchTool(ToolInterface):
@@ -76,10 +108,14 @@ class SearxSearchTool(ToolInterface):
 
     name = "Searx Search"
     description = "Get specific information from a search query. Input should be a question like 'How to add number in Clojure?'. Result will be the answer to the question."
+    cache_ttl = 3600.0  # Web search results change slowly
 
     def use(self, input_text: str) -> str:
         return search(input_text)
 
+    async def ause(self, input_text: str) -> str:
+        return await asearch(input_text)
+
 
 if __name__ == '__main__':
     s = SearxSearchTool()
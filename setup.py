@@ -9,10 +9,13 @@ setup(
     url='https://github.com/mpaepper/llm_agents',
     packages=find_packages(),
     install_requires=[
-        'google-search-results>=2.4.2',
+        'aiohttp>=3.8.4',
+        'lxml>=4.9.2',
         'openai>=0.27.0',
+        'orjson>=3.8.3',
         'pydantic>=1.10.5',
-        'requests>=2.28.2'
+        'requests>=2.28.2',
+        'tenacity>=8.2.2'
     ],
     classifiers=[
         'Programming Language :: Python :: 3',